@@ -0,0 +1,90 @@
+# Shared verify/rebuild runner for the summary tables that the request handlers keep current
+# incrementally with upsert_increment (spend_rollup, site_order_counter). Each table's script
+# only supplies the aggregation query over the order tables; see spend_rollups.py and
+# site_counters.py for the command-line usage.
+from app import app, db
+from decimal import Decimal
+import sys
+
+class SummaryTable:
+    """
+    A summary table and how to recompute it. compute(conn) aggregates the order tables into
+    {key: [values]}, with key and values in the order of key_columns and value_columns.
+    If version_column is set, rebuilds carry it on past its stored value instead of resetting it.
+    """
+    def __init__(self, model, key_columns, value_columns, compute, label, script, version_column=None):
+        self.model = model
+        self.key_columns = key_columns
+        self.value_columns = value_columns
+        self.compute = compute
+        self.label = label
+        self.script = script
+        self.version_column = version_column
+
+    def stored(self, conn):
+        columns = [getattr(self.model, name) for name in self.key_columns + self.value_columns]
+        numeric = [isinstance(column.type, db.Numeric) for column in columns[len(self.key_columns):]]
+        stored = {}
+        for row in conn.execute(db.select(*columns)):
+            key, values = tuple(row[:len(self.key_columns)]), row[len(self.key_columns):]
+            stored[key] = [
+                Decimal(str(value)).quantize(Decimal("0.01")) if is_numeric else value
+                for value, is_numeric in zip(values, numeric)
+            ]
+        return stored
+
+    def rebuild(self, conn=None):
+        """
+        Replace the table contents in one transaction. Migrations pass their own connection,
+        which has no statement timeout; otherwise the app session is used.
+        """
+        conn = db.session if conn is None else conn
+        computed = self.compute(conn)
+        versions = {}
+        if self.version_column:
+            key = [getattr(self.model, name) for name in self.key_columns]
+            versions = {tuple(row[:-1]): row[-1] for row in conn.execute(db.select(*key, getattr(self.model, self.version_column)))}
+        conn.execute(db.delete(self.model))
+        rows = []
+        for key, values in computed.items():
+            row = dict(zip(self.key_columns, key))
+            row.update(zip(self.value_columns, values))
+            if self.version_column:
+                row[self.version_column] = versions.get(key, 0) + 1
+            rows.append(row)
+        if rows:
+            conn.execute(db.insert(self.model), rows)
+        conn.commit()
+        print(f"Rebuilt {len(rows)} {self.label} rows")
+
+    def verify(self):
+        """
+        Report rows that differ from the order tables. Returns True if they all match.
+        A stored row of zeros (e.g. only ever held orders that were later declined) matches no row.
+        """
+        expected = self.compute(db.session)
+        actual = self.stored(db.session)
+        empty = [Decimal("0.00") if isinstance(getattr(self.model, name).type, db.Numeric) else 0 for name in self.value_columns]
+        mismatches = 0
+        for key in sorted(set(expected) | set(actual)):
+            if expected.get(key, empty) != actual.get(key, empty):
+                mismatches += 1
+                print(f"Mismatch for {' '.join(str(part) for part in key)}: stored {actual.get(key)}, expected {expected.get(key)}")
+        if mismatches:
+            print(f"{mismatches} {self.label} rows are inconsistent; run 'python {self.script} rebuild'")
+            return False
+        print(f"All {len(expected)} {self.label} rows are consistent")
+        return True
+
+    def main(self):
+        command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+        with app.app_context():
+            if command == "rebuild":
+                self.rebuild()
+                ok = self.verify()
+            elif command == "verify":
+                ok = self.verify()
+            else:
+                print(f"Usage: python {self.script} [verify|rebuild]")
+                sys.exit(2)
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,100 @@
+# Move approved and declined orders older than a configurable age from the live order table
+# into order_archive (and their line items into order_item_archive).
+#
+# Usage:
+#   python archive_orders.py [--days N] [--batch-size N] [--dry-run]
+#
+# Orders are moved BATCH_SIZE at a time, each batch in its own transaction, so the job can be
+# stopped and re-run at any point: it simply continues with whatever is still in the live table.
+# Pending orders are never archived, however old. Archived orders stay visible on their print
+# page, as PDFs and in exports, but no longer appear on the dashboard or in search results.
+# On PostgreSQL a yearly partition of order_archive is created the first time it is needed.
+# Each batch bumps the version of the sites it touched, so API clients stop getting 304s for
+# orders that are no longer listed.
+from app import app, db, ArchivedOrder, ArchivedOrderItem, FINALIZED_STATUSES, Order, OrderItem, SiteOrderCounter
+from datetime import datetime, timedelta
+from sqlalchemy import text
+import argparse
+import os
+import time
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", 365))
+BATCH_SIZE = 1000
+
+def ensure_partitions(conn, years):
+    """
+    Create the yearly order_archive partitions for the given years if they do not exist yet.
+    """
+    for year in sorted(years):
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS order_archive_{year} PARTITION OF order_archive "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        ))
+
+def archive_batch(conn, cutoff, batch_size):
+    """
+    Move one batch of finalized orders created before cutoff. Returns the number moved.
+    """
+    ids = conn.execute(
+        db.select(Order.id)
+        .where(Order.status.in_(FINALIZED_STATUSES), Order.created_at < cutoff)
+        .order_by(Order.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+    if conn.dialect.name == "postgresql":
+        years = conn.execute(
+            db.select(db.func.extract("year", Order.created_at)).where(Order.id.in_(ids)).distinct()
+        ).scalars().all()
+        ensure_partitions(conn, {int(year) for year in years})
+
+    order_columns = [c.name for c in ArchivedOrder.__table__.columns]
+    conn.execute(ArchivedOrder.__table__.insert().from_select(
+        order_columns, db.select(*[Order.__table__.c[name] for name in order_columns]).where(Order.id.in_(ids))
+    ))
+    item_columns = [c.name for c in ArchivedOrderItem.__table__.columns]
+    conn.execute(ArchivedOrderItem.__table__.insert().from_select(
+        item_columns, db.select(*[OrderItem.__table__.c[name] for name in item_columns]).where(OrderItem.order_id.in_(ids))
+    ))
+    if conn.dialect.name == "sqlite":
+        # The FTS5 table has no foreign key; on PostgreSQL search rows go with the order (ON DELETE CASCADE)
+        conn.execute(text("DELETE FROM order_search WHERE rowid IN :ids").bindparams(db.bindparam("ids", ids, expanding=True)))
+    conn.execute(db.delete(OrderItem.__table__).where(OrderItem.order_id.in_(ids)))
+    sites = conn.execute(db.select(Order.site).where(Order.id.in_(ids)).distinct()).scalars().all()
+    conn.execute(db.delete(Order.__table__).where(Order.id.in_(ids)))
+    conn.execute(
+        db.update(SiteOrderCounter.__table__).where(SiteOrderCounter.site.in_(sites))
+        .values(version=SiteOrderCounter.version + 1)
+    )
+    conn.commit()
+    return len(ids)
+
+def archive_orders(days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, dry_run=False):
+    cutoff = datetime.now() - timedelta(days=days)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            if dry_run:
+                due = conn.execute(
+                    db.select(db.func.count()).select_from(Order.__table__)
+                    .where(Order.status.in_(FINALIZED_STATUSES), Order.created_at < cutoff)
+                ).scalar()
+                print(f"{due} orders created before {cutoff:%Y-%m-%d} would be archived")
+                return
+            started = time.perf_counter()
+            total = 0
+            while True:
+                moved = archive_batch(conn, cutoff, batch_size)
+                if not moved:
+                    break
+                total += moved
+                print(f"Archived {total} orders ({total / (time.perf_counter() - started):.0f} orders/s)")
+            print(f"Archived {total} orders created before {cutoff:%Y-%m-%d}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old approved and declined orders into the archive tables.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive orders created more than this many days ago")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many orders are due")
+    args = parser.parse_args()
+    archive_orders(args.days, args.batch_size, args.dry_run)
@@ -0,0 +1,242 @@
+# Benchmark the main request paths against a database seeded by seed_data.py.
+#
+# Usage:
+#   python benchmark.py [--scenarios dashboard,create,approve,login] [--requests 200] [--threads 1]
+#                       [--json results.json] [--baseline baseline.json] [--tolerance 0.25]
+#
+# Requests go through the real Flask routes in-process (Flask test client), so the numbers cover
+# the app and the database but not the network or gunicorn. Point DATABASE_URL at a SQLite file
+# or a local PostgreSQL database seeded with seed_data.py; the create and approve scenarios write
+# to it. Reports p50/p95/p99 latency and throughput per scenario. With --baseline, exits with
+# code 1 if any scenario's p95 is more than --tolerance slower than the baseline run.
+from app import app, db, DEFAULT_SITES, Order, User
+from seed_data import BENCH_PASSWORD, bench_username
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+SCENARIOS = ("dashboard", "create", "approve", "login")
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def logged_in_client(username):
+    client = app.test_client()
+    response = client.post("/login", data={"username": username, "password": BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in as {username}; run seed_data.py first")
+    return client
+
+def random_site(rng):
+    site_index = rng.randrange(len(DEFAULT_SITES)) + 1
+    return site_index, DEFAULT_SITES[site_index - 1]
+
+def pending_orders_by_site(limit_per_site):
+    """
+    Pending orders submitted by an Admin, per site, for Managers to approve.
+    """
+    with app.app_context():
+        rows = db.session.execute(
+            db.select(Order.site, Order.id)
+            .join(User, User.username == Order.submitter)
+            .where(Order.status == "pending", User.role == "Admin")
+            .order_by(Order.id)
+        )
+        pending = {}
+        for site, order_id in rows:
+            ids = pending.setdefault(site, [])
+            if len(ids) < limit_per_site:
+                ids.append(order_id)
+        return pending
+
+class Scenario:
+    """
+    Builds a client for each thread and issues one request per call. A request returns the
+    response status; expected_status marks success.
+    """
+    expected_status = 200
+
+    def __init__(self, thread_index):
+        self.rng = random.Random(thread_index)
+        self.site_index, self.site = random_site(self.rng)
+
+    def request(self):
+        raise NotImplementedError
+
+class Dashboard(Scenario):
+    def __init__(self, thread_index):
+        super().__init__(thread_index)
+        self.client = logged_in_client(bench_username("Manager", 1, self.site_index))
+
+    def request(self):
+        return self.client.get("/?per_page=50").status_code
+
+class CreateOrder(Scenario):
+    expected_status = 302
+
+    def __init__(self, thread_index):
+        super().__init__(thread_index)
+        self.client = logged_in_client(bench_username("Admin", 1, self.site_index))
+
+    def request(self):
+        return self.client.post("/create", data={
+            "supplier": "Benchmark Supplier",
+            "item_desc[]": ["Potenza tyre 205/55R16", "Wheel balancing weights"],
+            "item_qty[]": ["4", "1"],
+            "item_unit_cost[]": ["1450.00", "85.50"],
+            "item_total_cost[]": ["5800.00", "85.50"],
+            "amount": "6768.33",
+            "submitter_emp_number": "10001",
+            "submitter_emp_name": "Bench Runner",
+        }).status_code
+
+class ApproveOrder(Scenario):
+    expected_status = 302
+    pending = None  # Shared across threads; each order is approved at most once
+    lock = threading.Lock()
+
+    def __init__(self, thread_index):
+        super().__init__(thread_index)
+        with self.lock:
+            # Busiest sites first, so each thread has plenty of pending orders to work through
+            sites = sorted(self.pending, key=lambda s: len(self.pending[s]), reverse=True)
+            self.site = sites[thread_index % len(sites)]
+            self.site_index = DEFAULT_SITES.index(self.site) + 1
+        self.client = logged_in_client(bench_username("Manager", 1, self.site_index))
+
+    def request(self):
+        with self.lock:
+            if not self.pending[self.site]:
+                raise StopIteration(f"No pending orders left at {self.site}")
+            order_id = self.pending[self.site].pop()
+        return self.client.post(f"/approve/{order_id}", data={
+            "approver_emp_number": "20002",
+            "approver_emp_name": "Bench Approver",
+        }).status_code
+
+class Login(Scenario):
+    expected_status = 302
+
+    def request(self):
+        # A fresh client each time; a logged-in session would skip the password check
+        site_index, _ = random_site(self.rng)
+        return app.test_client().post("/login", data={
+            "username": bench_username(self.rng.choice(("Admin", "Manager")), 1, site_index),
+            "password": BENCH_PASSWORD,
+        }).status_code
+
+SCENARIO_CLASSES = {"dashboard": Dashboard, "create": CreateOrder, "approve": ApproveOrder, "login": Login}
+
+def run_scenario(name, requests, threads, warmup):
+    per_thread = max(1, requests // threads)
+    latencies, errors = [], []
+    result_lock = threading.Lock()
+    workers = [SCENARIO_CLASSES[name](i) for i in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def work(scenario):
+        local_latencies, local_errors = [], 0
+        try:
+            try:
+                for _ in range(warmup):
+                    scenario.request()
+            except BaseException:
+                # Release the threads already waiting at the barrier instead of hanging the run
+                barrier.abort()
+                raise
+            barrier.wait()
+            for _ in range(per_thread):
+                started = time.perf_counter()
+                status = scenario.request()
+                local_latencies.append(time.perf_counter() - started)
+                if status != scenario.expected_status:
+                    local_errors += 1
+        except StopIteration as e:
+            print(f"  {name}: {e}")
+        except threading.BrokenBarrierError:
+            print(f"  {name}: another thread failed during warm-up")
+        finally:
+            with result_lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=work, args=(w,)) for w in workers]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if not latencies:
+        return None
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+def compare(results, baseline, tolerance):
+    """
+    Print p95 changes against a previous run. Returns True if nothing regressed.
+    """
+    ok = True
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not result or not before:
+            continue
+        change = result["p95_ms"] / before["p95_ms"] - 1
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{name:<10} p95 {before['p95_ms']:8.1f} -> {result['p95_ms']:8.1f} ms ({change:+.0%})"
+              f"{'  REGRESSION' if regressed else ''}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the main request paths.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent clients per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per thread before measuring")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 slowdown against the baseline")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIO_CLASSES]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    print(f"Benchmarking against {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]}")
+    if "approve" in names:
+        needed = (args.requests // args.threads + args.warmup) * 2
+        ApproveOrder.pending = pending_orders_by_site(needed)
+        if not ApproveOrder.pending:
+            print("No pending orders to approve; run seed_data.py first")
+            names.remove("approve")
+
+    results = {}
+    print(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name in names:
+        result = results[name] = run_scenario(name, args.requests, args.threads, args.warmup)
+        if result:
+            print(f"{name:<10} {result['requests']:>8} {result['errors']:>6} {result['throughput']:>8.1f} "
+                  f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(0 if compare(results, baseline, args.tolerance) else 1)
+
+if __name__ == "__main__":
+    main()
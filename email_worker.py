@@ -0,0 +1,162 @@
+# Background worker that drains the email outbox written by the request handlers.
+#
+# Usage:
+#   python email_worker.py          Poll the outbox forever
+#   python email_worker.py --once   Deliver everything currently due, then exit
+#
+# Delivery is at-least-once: a message is marked sent only after the SMTP relay accepts it.
+# Order PDFs are rendered here (headless Chrome, CHROME_BIN) and stored in order_pdf: supplier
+# attachments just before sending, and PDF downloads that the web app queued.
+# Failed messages are retried with exponential backoff and marked "dead" after MAX_ATTEMPTS.
+# If EMAIL_WORKER_METRICS_PORT is set, SMTP latency and failures are served on that port at
+# /metrics, in the same format as the web app's /metrics.
+from app import app, db, EmailOutbox, OrderPDF, PDF_MAX_ATTEMPTS, smtp_pool, metrics_exposition, render_order_pdf
+from datetime import datetime, timedelta
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+import os
+import sys
+import threading
+import time
+
+POLL_INTERVAL = float(os.getenv("EMAIL_WORKER_POLL_INTERVAL", 5))  # Seconds between polls when idle
+BATCH_SIZE = int(os.getenv("EMAIL_WORKER_BATCH_SIZE", 20))
+MAX_ATTEMPTS = int(os.getenv("EMAIL_WORKER_MAX_ATTEMPTS", 8))
+BACKOFF_BASE = 30  # Seconds before the first retry, doubled on each further attempt
+BACKOFF_MAX = 3600
+METRICS_PORT = os.getenv("EMAIL_WORKER_METRICS_PORT")
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass  # One line per scrape is noise in the worker log
+
+def metrics_app(environ, start_response):
+    if environ.get("PATH_INFO") != "/metrics":
+        start_response("404 Not Found", [("Content-Type", "text/plain")])
+        return [b"Not Found"]
+    body = metrics_exposition([
+        "# HELP smtp_connections_total SMTP sessions opened by this process.",
+        "# TYPE smtp_connections_total counter",
+        f"smtp_connections_total {smtp_pool.connect_count}",
+    ])
+    start_response("200 OK", [("Content-Type", "text/plain; version=0.0.4; charset=utf-8")])
+    return [body.encode()]
+
+def serve_metrics(port):
+    server = make_server("0.0.0.0", port, metrics_app, handler_class=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving email worker metrics on port {port}")
+
+def backoff_delay(attempts):
+    return min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+
+def claim_batch():
+    """
+    Select due outbox messages. On PostgreSQL the rows are locked with SKIP LOCKED
+    so several workers can run side by side without sending the same message twice.
+    """
+    return (
+        EmailOutbox.query
+        .filter(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= datetime.now())
+        .order_by(EmailOutbox.id)
+        .limit(BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+def process_batch():
+    """
+    Deliver one batch of due messages. Returns the number of messages attempted.
+    """
+    messages = claim_batch()
+    if not messages:
+        return 0
+    errors = {}
+    outgoing = []
+    for m in messages:
+        attachment = (m.attachment_filename, m.attachment) if m.attachment else None
+        if attachment is None and m.pdf_order_id:
+            try:
+                attachment = (m.attachment_filename, render_order_pdf(m.pdf_order_id))
+            except Exception as e:
+                errors[m.id] = e  # Retried with backoff like a failed send
+                continue
+        outgoing.append((m, (m.recipient, m.subject, m.body, attachment)))
+    # The whole batch goes out over one pooled SMTP session
+    results = smtp_pool.send_batch([message for _, message in outgoing]) if outgoing else []
+    errors.update((m.id, error) for (m, _), error in zip(outgoing, results))
+    for message in messages:
+        error = errors[message.id]
+        message.attempts += 1
+        if error is None:
+            message.status = "sent"
+            message.sent_at = datetime.now()
+            message.last_error = None
+            continue
+        message.last_error = str(error)[:500]
+        if message.attempts >= MAX_ATTEMPTS:
+            message.status = "dead"
+            print(f"Email {message.id} to {message.recipient} dead-lettered after {message.attempts} attempts: {error}")
+        else:
+            delay = backoff_delay(message.attempts)
+            message.next_attempt_at = datetime.now() + timedelta(seconds=delay)
+            print(f"Email {message.id} to {message.recipient} failed (attempt {message.attempts}), retrying in {delay}s: {error}")
+    db.session.commit()
+    stats = smtp_pool.latency_stats()
+    if stats["count"]:
+        print(f"Processed batch of {len(messages)}: avg {stats['avg'] * 1000:.0f} ms, "
+              f"p95 {stats['p95'] * 1000:.0f} ms per message over {stats['connects']} SMTP connects")
+    else:
+        print(f"Processed batch of {len(messages)}: no message reached the SMTP relay")
+    return len(messages)
+
+def render_pdf_batch():
+    """
+    Render one batch of PDFs queued by /print/<id>/pdf. Returns the number of renders attempted.
+    """
+    requests = (
+        OrderPDF.query
+        .filter(OrderPDF.rendered_at.is_(None), OrderPDF.attempts < PDF_MAX_ATTEMPTS)
+        .order_by(OrderPDF.requested_at)
+        .limit(BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for pdf_request in requests:
+        try:
+            render_order_pdf(pdf_request.order_id)
+        except Exception as e:
+            pdf_request.attempts += 1
+            pdf_request.last_error = str(e)[:500]
+            print(f"PDF for order {pdf_request.order_id} failed (attempt {pdf_request.attempts}): {e}")
+            continue
+        db.session.expire(pdf_request)
+        if pdf_request.rendered_at is None:
+            # The order changed status while queued; its PDF was stored under the new status
+            db.session.delete(pdf_request)
+    db.session.commit()
+    if requests:
+        print(f"Rendered batch of {len(requests)} queued PDFs")
+    return len(requests)
+
+def run(once=False):
+    if METRICS_PORT:
+        serve_metrics(int(METRICS_PORT))
+    with app.app_context():
+        print("Email worker started")
+        while True:
+            try:
+                attempted = process_batch() + render_pdf_batch()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Email worker error: {e}")
+                attempted = 0
+            if attempted:
+                continue
+            if once:
+                break
+            time.sleep(POLL_INTERVAL)
+        smtp_pool.close_all()
+        print("Email worker finished")
+
+if __name__ == "__main__":
+    run(once="--once" in sys.argv)
@@ -0,0 +1,50 @@
+# Gunicorn settings, picked up automatically when gunicorn is started from this directory.
+#
+# Every setting can be overridden from the environment:
+#   WEB_CONCURRENCY          Worker processes (default: number of CPU cores, at least 2)
+#   GUNICORN_THREADS         Threads per worker (default: 4). The database pool in app.py is
+#                            sized from the same variable (DB_POOL_SIZE overrides it), so the
+#                            app opens at most WEB_CONCURRENCY x (threads + DB_MAX_OVERFLOW)
+#                            connections. Keep that below the PostgreSQL plan's connection limit.
+#                            Open dashboard event streams (/events) each hold a thread, so under
+#                            gthread they are off unless LIVE_UPDATES_ENABLED=true and dashboards
+#                            check for changes every LIVE_UPDATES_CHECK_SECONDS instead. app.py
+#                            caps streams at half the threads per worker (LIVE_UPDATES_MAX_STREAMS).
+#   GUNICORN_WORKER_CLASS    "gthread" (default) or "gevent". gevent and psycogreen must be installed
+#                            separately (psycopg2 is patched to yield to other requests while it
+#                            waits on the database), and DB_POOL_SIZE should then match
+#                            GUNICORN_WORKER_CONNECTIONS. Suits many open dashboards: event streams
+#                            are on by default under gevent, capped at half of
+#                            GUNICORN_WORKER_CONNECTIONS per worker.
+#   GUNICORN_WORKER_CONNECTIONS  Concurrent requests per gevent worker (default: 100)
+#   GUNICORN_TIMEOUT         Seconds before a stuck worker is restarted (default: 90)
+#   GUNICORN_MAX_REQUESTS    Requests before a worker is recycled (default: 1000, 0 disables)
+#
+# Database pool and statement timeouts are configured in app.py (DB_* variables).
+#
+# The application is imported once in the master process and workers are forked from it,
+# instead of every worker importing app.py and building its own engine.
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", max(2, os.cpu_count() or 1)))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 90))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = max_requests // 10  # Workers restart at different times
+
+preload_app = True
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # psycopg2 waits for the server in C, which would block every greenlet in the worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    # Database connections must never be shared between processes. Importing the app opens
+    # none, but drop anything the master may have opened so each worker starts its own pool.
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,109 @@
+# Import monthly site budgets from a finance workbook such as Coastal_Budget_FY26_Summary.xlsx.
+#
+# Usage:
+#   python import_budgets.py [workbook.xlsx] --sheet NAME [--fy-start YEAR]
+#
+# NAME must be the purchasing (spend) budget sheet: the dashboard subtracts approved and pending
+# order spend from it. The sheets of the FY26 summary workbook (Turnover, Trading Gross Profit,
+# EBITDA, unit and headcount targets, ...) are sales and operating targets, not spend budgets,
+# and are refused; finance adds the spend budget to the workbook as its own sheet.
+# The sheet is expected in the finance layout: a header row with the months July..June
+# starting in column C, and one row per site ("TWT ...") with amounts underneath.
+# Region headings, region totals and blank cells are skipped. Existing budgets for the
+# same site and month are replaced.
+from app import app, db, SiteBudget, get_site_set
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from openpyxl import load_workbook
+import argparse
+import sys
+
+FISCAL_MONTHS = ["July", "August", "September", "October", "November", "December",
+                 "January", "February", "March", "April", "May", "June"]
+
+# Sheets of the finance summary workbook that hold targets other than purchasing spend
+NOT_SPEND_BUDGET_SHEETS = {
+    "Turnover", "Trading Gross Profit", "Trading GP%", "EBITDA", "Tyre Units", "Tyre ARPU",
+    "Wheel Units", "Battery Units", "Staff Heads",
+}
+
+def month_for(fy_start, month_name):
+    """
+    Map a fiscal month name to the first day of that month. FY26 runs July 2025 - June 2026.
+    """
+    index = FISCAL_MONTHS.index(month_name)
+    return date(fy_start + (1 if index >= 6 else 0), (index + 6) % 12 + 1, 1)
+
+def check_budget_sheet(path, sheet_name):
+    """
+    Raise ValueError unless the workbook has the sheet and it is not one of the known target sheets.
+    """
+    if sheet_name in NOT_SPEND_BUDGET_SHEETS:
+        raise ValueError(f"sheet {sheet_name!r} holds {sheet_name} targets, not a spend budget")
+    workbook = load_workbook(path, read_only=True)
+    sheet_names = workbook.sheetnames
+    workbook.close()
+    if sheet_name not in sheet_names:
+        raise ValueError(f"{path} has no sheet {sheet_name!r}; it has {', '.join(sheet_names)}")
+
+def read_budgets(path, sheet_name, fy_start, known_sites):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    sheet = workbook[sheet_name]
+    month_columns = None
+    budgets = []
+    skipped = set()
+    for row in sheet.iter_rows(values_only=True):
+        label = row[0].strip() if isinstance(row[0], str) else None
+        # The month header row is repeated once per region block
+        if len(row) > 2 and row[2] == "July":
+            month_columns = {i: value for i, value in enumerate(row) if value in FISCAL_MONTHS}
+            continue
+        if not label or month_columns is None:
+            continue
+        if label not in known_sites:
+            if label.startswith("TWT "):
+                skipped.add(label)  # Region totals and stores not yet in the site registry
+            continue
+        for column, month_name in month_columns.items():
+            value = row[column] if column < len(row) else None
+            if value is None or value == "":
+                continue
+            try:
+                amount = Decimal(str(value)).quantize(Decimal("0.01"))
+            except InvalidOperation:
+                print(f"Skipping non-numeric budget for {label} {month_name}: {value!r}")
+                continue
+            budgets.append((label, month_for(fy_start, month_name), amount))
+    workbook.close()
+    return budgets, skipped
+
+def import_budgets(path, sheet_name, fy_start=2025):
+    check_budget_sheet(path, sheet_name)
+    with app.app_context():
+        budgets, skipped = read_budgets(path, sheet_name, fy_start, get_site_set())
+        existing = {
+            (b.site, b.month): b
+            for b in SiteBudget.query.filter(SiteBudget.site.in_({site for site, _, _ in budgets})).all()
+        } if budgets else {}
+        for site, month, amount in budgets:
+            budget = existing.get((site, month))
+            if budget:
+                budget.amount = amount
+            else:
+                db.session.add(SiteBudget(site=site, month=month, amount=amount))
+        db.session.commit()
+        print(f"Imported {len(budgets)} monthly budgets from {path}")
+        if skipped:
+            print(f"Skipped rows that are not registered sites: {', '.join(sorted(skipped))}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import monthly site budgets from a finance workbook.")
+    parser.add_argument("workbook", nargs="?", default="Coastal_Budget_FY26_Summary.xlsx")
+    parser.add_argument("--sheet", required=True, help="Worksheet holding the purchasing (spend) budget")
+    parser.add_argument("--fy-start", type=int, default=2025, help="Calendar year the fiscal year starts in (July)")
+    args = parser.parse_args()
+    try:
+        import_budgets(args.workbook, args.sheet, args.fy_start)
+    except ValueError as e:
+        print(f"Not imported: {e}")
+        sys.exit(2)
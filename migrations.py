@@ -0,0 +1,329 @@
+# Versioned schema migrations. Replaces the old one-off add_site_field.py script.
+#
+# Usage:
+#   python migrations.py           Apply all pending migrations
+#   python migrations.py status    List applied and pending migrations
+#
+# Each migration runs once; applied versions are recorded in the schema_migrations table.
+from app import (
+    app, db, ArchivedOrder, ArchivedOrderItem, EmailOutbox, OrderItem, OrderPDF, Site, SiteBudget, SiteOrderCounter, SpendRollup, DEFAULT_SITES,
+    parse_legacy_description, create_search_index, search_document, write_search_documents
+)
+from sqlalchemy import inspect, text
+from datetime import datetime
+import sys
+
+# Rows touched per transaction by data backfills, so large tables are never locked as a whole
+BATCH_SIZE = 1000
+
+MIGRATIONS = []
+
+def migration(version, description):
+    """
+    Register a migration function under a version number.
+    """
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+def is_postgres(conn):
+    return conn.dialect.name == "postgresql"
+
+def has_column(conn, table, column):
+    return column in [c["name"] for c in inspect(conn).get_columns(table)]
+
+def create_index(conn, name, table, columns, using=None):
+    """
+    Create an index if it does not exist yet. On PostgreSQL the index is built
+    CONCURRENTLY so writes to the table are not blocked while it is built.
+    using names a PostgreSQL index method other than btree, e.g. "GIN".
+    """
+    cols = ", ".join(columns)
+    if is_postgres(conn):
+        method = f" USING {using}" if using else ""
+        conn.commit()
+        autocommit = conn.execution_options(isolation_level="AUTOCOMMIT")
+        autocommit.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "{table}"{method} ({cols})'))
+        # Even in AUTOCOMMIT mode the execute began a (no-op) transaction, and the isolation
+        # level cannot be changed while one is open
+        conn.commit()
+        conn.execution_options(isolation_level=conn.default_isolation_level)
+    else:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({cols})'))
+    print(f"Ensured index {name} on {table} ({cols})")
+
+def drop_index(conn, name):
+    """
+    Drop an index if it exists; CONCURRENTLY on PostgreSQL, like create_index.
+    """
+    if is_postgres(conn):
+        conn.commit()
+        autocommit = conn.execution_options(isolation_level="AUTOCOMMIT")
+        autocommit.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.commit()
+        conn.execution_options(isolation_level=conn.default_isolation_level)
+    else:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    print(f"Dropped index {name} if it existed")
+
+def backfill_in_batches(conn, table, select_ids_sql, update_sql, params=None):
+    """
+    Run update_sql for ids returned by select_ids_sql, BATCH_SIZE rows per transaction.
+    select_ids_sql must accept :last_id and :batch_size and return ids in ascending order;
+    update_sql receives the batch as :first_id/:last_id bounds.
+    """
+    params = dict(params or {})
+    last_id = 0
+    total = 0
+    while True:
+        ids = conn.execute(text(select_ids_sql), {**params, "last_id": last_id, "batch_size": BATCH_SIZE}).scalars().all()
+        if not ids:
+            break
+        conn.execute(text(update_sql), {**params, "first_id": ids[0], "last_id": ids[-1]})
+        conn.commit()
+        total += len(ids)
+        last_id = ids[-1]
+    print(f"Processed {total} rows needing backfill in {table}")
+
+########################################
+# Migrations
+########################################
+@migration(1, "Create base tables")
+def create_base_tables(conn):
+    db.metadata.create_all(bind=conn)
+    conn.commit()
+
+@migration(2, "Add site to user and order, backfill from submitter")
+def add_site_columns(conn):
+    for table in ("user", "order"):
+        if not has_column(conn, table, "site"):
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN site VARCHAR(100)'))
+            conn.commit()
+            print(f"Added site column to {table} table")
+
+    backfill_in_batches(
+        conn, "user",
+        'SELECT id FROM "user" WHERE site IS NULL AND id > :last_id ORDER BY id LIMIT :batch_size',
+        'UPDATE "user" SET site = :site WHERE site IS NULL AND id BETWEEN :first_id AND :last_id',
+        {"site": "TWT Alberton"}
+    )
+    backfill_in_batches(
+        conn, "order",
+        'SELECT id FROM "order" WHERE site IS NULL AND id > :last_id ORDER BY id LIMIT :batch_size',
+        '''UPDATE "order" SET site = (
+               SELECT u.site FROM "user" u WHERE u.username = "order".submitter
+           )
+           WHERE site IS NULL AND id BETWEEN :first_id AND :last_id'''
+    )
+
+@migration(3, "Add composite indexes for dashboard, approver and reset lookups")
+def add_hot_query_indexes(conn):
+    create_index(conn, "ix_order_site_created_at", "order", ["site", "created_at", "id"])
+    create_index(conn, "ix_order_submitter", "order", ["submitter"])
+    create_index(conn, "ix_user_site_role", "user", ["site", "role"])
+    create_index(conn, "ix_user_email_site", "user", ["email", "site"])
+
+@migration(4, "Create email outbox table")
+def create_email_outbox(conn):
+    db.metadata.create_all(bind=conn, tables=[EmailOutbox.__table__])
+    conn.commit()
+
+@migration(5, "Create order_item table and parse packed descriptions into items")
+def create_order_items(conn):
+    db.metadata.create_all(bind=conn, tables=[OrderItem.__table__])
+    conn.commit()
+
+    # Walk orders by id in batches, converting those that have no item rows yet,
+    # so the job can be interrupted and re-run safely.
+    last_id = 0
+    converted = 0
+    while True:
+        rows = conn.execute(text("""
+            SELECT o.id, o.description FROM "order" o
+            WHERE o.id > :last_id
+            AND NOT EXISTS (SELECT 1 FROM order_item i WHERE i.order_id = o.id)
+            ORDER BY o.id LIMIT :batch_size
+        """), {"last_id": last_id, "batch_size": BATCH_SIZE}).all()
+        if not rows:
+            break
+        items = []
+        for order_id, description in rows:
+            for item in parse_legacy_description(description):
+                item["order_id"] = order_id
+                items.append(item)
+        if items:
+            conn.execute(OrderItem.__table__.insert(), items)
+        conn.commit()
+        converted += len(rows)
+        last_id = rows[-1][0]
+    print(f"Parsed line items for {converted} orders")
+
+@migration(6, "Add attachment columns to email outbox")
+def add_outbox_attachments(conn):
+    if not has_column(conn, "email_outbox", "attachment_filename"):
+        conn.execute(text("ALTER TABLE email_outbox ADD COLUMN attachment_filename VARCHAR(200)"))
+    if not has_column(conn, "email_outbox", "attachment"):
+        binary_type = "BYTEA" if is_postgres(conn) else "BLOB"
+        conn.execute(text(f"ALTER TABLE email_outbox ADD COLUMN attachment {binary_type}"))
+    conn.commit()
+
+@migration(7, "Create site table and seed the Tiger Wheel & Tyre sites")
+def create_sites(conn):
+    db.metadata.create_all(bind=conn, tables=[Site.__table__])
+    existing = set(conn.execute(text("SELECT name FROM site")).scalars().all())
+    missing = [{"name": name, "active": True} for name in DEFAULT_SITES if name not in existing]
+    if missing:
+        conn.execute(Site.__table__.insert(), missing)
+    conn.commit()
+    print(f"Seeded {len(missing)} sites")
+
+@migration(8, "Create site budget and spend rollup tables, build rollups from existing orders")
+def create_budget_tables(conn):
+    db.metadata.create_all(bind=conn, tables=[SiteBudget.__table__, SpendRollup.__table__])
+    conn.commit()
+    import spend_rollups
+    spend_rollups.rebuild(conn)
+
+@migration(9, "Add order.updated_at for change tracking")
+def add_order_updated_at(conn):
+    if not has_column(conn, "order", "updated_at"):
+        conn.execute(text('ALTER TABLE "order" ADD COLUMN updated_at TIMESTAMP'))
+        conn.commit()
+    backfill_in_batches(
+        conn, "order",
+        'SELECT id FROM "order" WHERE updated_at IS NULL AND id > :last_id ORDER BY id LIMIT :batch_size',
+        '''UPDATE "order" SET updated_at = COALESCE(approved_at, created_at)
+           WHERE updated_at IS NULL AND id BETWEEN :first_id AND :last_id'''
+    )
+    create_index(conn, "ix_order_site_updated_at", "order", ["site", "updated_at"])
+
+@migration(10, "Create the order_search full-text index and index existing orders")
+def create_order_search(conn):
+    create_search_index(conn)
+    conn.commit()
+
+    last_id = 0
+    indexed = 0
+    while True:
+        orders = conn.execute(text("""
+            SELECT id, site, supplier, submitter_emp_name, submitter_emp_number,
+                   approver_emp_name, approver_emp_number
+            FROM "order" WHERE id > :last_id ORDER BY id LIMIT :batch_size
+        """), {"last_id": last_id, "batch_size": BATCH_SIZE}).all()
+        if not orders:
+            break
+        descriptions = {}
+        for order_id, description in conn.execute(text(
+            "SELECT order_id, description FROM order_item WHERE order_id BETWEEN :first_id AND :last_id ORDER BY order_id, position"
+        ), {"first_id": orders[0].id, "last_id": orders[-1].id}):
+            descriptions.setdefault(order_id, []).append(description)
+        write_search_documents(conn, [
+            {
+                "order_id": o.id,
+                "site": o.site,
+                "document": search_document(
+                    o.id, o.supplier, descriptions.get(o.id, []),
+                    o.submitter_emp_name, o.submitter_emp_number, o.approver_emp_name, o.approver_emp_number
+                ),
+            }
+            for o in orders
+        ])
+        conn.commit()
+        indexed += len(orders)
+        last_id = orders[-1].id
+    print(f"Indexed {indexed} orders for search")
+
+@migration(11, "Create order archive tables (order_archive partitioned by created_at on PostgreSQL)")
+def create_order_archive(conn):
+    db.metadata.create_all(bind=conn, tables=[ArchivedOrder.__table__, ArchivedOrderItem.__table__])
+    conn.commit()
+
+@migration(12, "Create site order counters table, count existing orders")
+def create_site_counters(conn):
+    db.metadata.create_all(bind=conn, tables=[SiteOrderCounter.__table__])
+    conn.commit()
+    import site_counters
+    site_counters.rebuild(conn)
+
+@migration(13, "Add email_outbox.pdf_order_id for PDFs rendered by the email worker")
+def add_outbox_pdf_order_id(conn):
+    if not has_column(conn, "email_outbox", "pdf_order_id"):
+        conn.execute(text("ALTER TABLE email_outbox ADD COLUMN pdf_order_id INTEGER"))
+    conn.commit()
+
+@migration(14, "Add site_order_counter.version for API ETags")
+def add_site_counter_version(conn):
+    if not has_column(conn, "site_order_counter", "version"):
+        conn.execute(text("ALTER TABLE site_order_counter ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+    conn.commit()
+
+@migration(15, "Index order_search by site and document together (PostgreSQL)")
+def add_site_search_index(conn):
+    # SQLite's FTS5 table already matches the site key and the terms in one lookup
+    if not is_postgres(conn):
+        return
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+    conn.commit()
+    create_index(conn, "ix_order_search_site_document", "order_search", ["site", "document"], using="GIN")
+    drop_index(conn, "ix_order_search_document")
+    drop_index(conn, "ix_order_search_site")
+
+@migration(16, "Create order_pdf table for PDFs rendered by the email worker")
+def create_order_pdf(conn):
+    db.metadata.create_all(bind=conn, tables=[OrderPDF.__table__])
+    conn.commit()
+
+########################################
+# Runner
+########################################
+def ensure_version_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """))
+    conn.commit()
+
+def applied_versions(conn):
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars().all())
+
+def migrate():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            if is_postgres(conn):
+                # Backfills and index builds may run longer than the web request statement timeout
+                conn.execute(text("SET statement_timeout = 0"))
+                conn.commit()
+            ensure_version_table(conn)
+            applied = applied_versions(conn)
+            pending = [m for m in sorted(MIGRATIONS, key=lambda m: m[0]) if m[0] not in applied]
+            if not pending:
+                print("Database schema is up to date")
+                return
+            for version, description, func in pending:
+                print(f"Applying migration {version}: {description}")
+                func(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": version, "d": description, "t": datetime.now()}
+                )
+                conn.commit()
+            print("Migration completed successfully")
+
+def status():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            ensure_version_table(conn)
+            applied = applied_versions(conn)
+            for version, description, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+                state = "applied" if version in applied else "pending"
+                print(f"{version:>4}  {state:<8} {description}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        status()
+    else:
+        migrate()
@@ -0,0 +1,57 @@
+# Measure password hashing cost and the login throughput it allows per CPU core.
+#
+# Usage:
+#   python password_benchmark.py [METHOD ...] [--seconds S] [--processes N]
+#
+# METHOD is a Werkzeug hash method such as pbkdf2:sha256:600000 or scrypt:32768:8:1; the
+# default is the configured PASSWORD_HASH_METHOD. Each login verifies one hash, so logins per
+# second per core is roughly 1 / verify time. With --processes N the verification runs in N
+# processes at once to show how throughput scales across cores (and memory-hard methods such
+# as scrypt compete for memory bandwidth).
+from app import PASSWORD_HASH_METHOD
+from werkzeug.security import check_password_hash, generate_password_hash
+from multiprocessing import Pool
+import argparse
+import os
+import time
+
+PASSWORD = "Benchmark-Passw0rd!"
+
+def verify_for(stored_hash, seconds):
+    """
+    Verify stored_hash repeatedly for about `seconds`. Returns the number of verifications.
+    """
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        check_password_hash(stored_hash, PASSWORD)
+        count += 1
+    return count
+
+def benchmark(method, seconds, processes):
+    start = time.perf_counter()
+    stored_hash = generate_password_hash(PASSWORD, method=method)
+    hash_ms = (time.perf_counter() - start) * 1000
+
+    verifications = verify_for(stored_hash, seconds)
+    per_core = verifications / seconds
+    print(f"{stored_hash.split('$', 1)[0]:<26} hash {hash_ms:7.1f} ms  verify {1000 / per_core:7.1f} ms  "
+          f"{per_core:7.1f} logins/s per core")
+
+    if processes > 1:
+        with Pool(processes) as pool:
+            counts = pool.starmap(verify_for, [(stored_hash, seconds)] * processes)
+        total = sum(counts) / seconds
+        print(f"{'':<26} {processes} processes: {total:7.1f} logins/s total, {total / processes:7.1f} per process")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure password hashing cost and login throughput.")
+    parser.add_argument("methods", nargs="*", default=[PASSWORD_HASH_METHOD])
+    parser.add_argument("--seconds", type=float, default=3.0, help="How long to verify hashes for each method")
+    parser.add_argument("--processes", type=int, default=1, help=f"Parallel processes (this machine has {os.cpu_count()} cores)")
+    args = parser.parse_args()
+    for method in args.methods:
+        benchmark(method, args.seconds, args.processes)
+
+if __name__ == "__main__":
+    main()
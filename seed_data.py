@@ -0,0 +1,170 @@
+# Seed a database with realistic volumes of users, orders and line items for benchmarking.
+#
+# Usage:
+#   python migrations.py                      Create the schema first
+#   python seed_data.py [--orders 1000000] [--users-per-role 2] [--days 730] [--seed 1]
+#
+# Every site in DEFAULT_SITES gets Admin and Manager users (password BENCH_PASSWORD) and a share
+# of the orders, weighted so some stores are much busier than others. Orders are spread over the
+# last --days days with a mix of pending, approved and declined statuses and 1-5 line items each.
+# Spend rollups, site counters and the search index are rebuilt at the end unless --skip-derived
+# is given.
+#
+# Never run this against production: it adds data to whatever DATABASE_URL points at.
+from app import app, db, DEFAULT_SITES, Order, OrderItem, User, hash_password
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import text
+import argparse
+import random
+import time
+
+BENCH_PASSWORD = "Bench123!"
+BATCH_SIZE = 5000  # Orders inserted per transaction
+
+SUPPLIERS = [
+    "Bridgestone SA", "Continental Tyre SA", "Goodyear SA", "Dunlop Tyres", "Pirelli Tyres SA",
+    "Michelin SA", "Hankook Tyres", "Kumho Tyres", "Yokohama SA", "BFGoodrich",
+    "Tiger Wheel Distribution", "Monroe Shocks", "Exide Batteries", "Willard Batteries",
+    "Bosch Automotive", "Castrol SA", "Engen Lubricants", "Hella Lighting", "Ferodo Brakes",
+    "Midas Parts", "Goldwagen", "AutoZone Trade", "Makro Trade", "Office National",
+]
+ITEM_DESCRIPTIONS = [
+    "Potenza tyre 205/55R16", "Turanza tyre 195/65R15", "Dueler A/T 265/65R17", "Ecopia 185/65R14",
+    "Wheel balancing weights", "Valve stems (box of 100)", "Tyre sealant 500ml", "Nitrogen refill cylinder",
+    "Alignment clamp set", "Mag wheel 15 inch", "Mag wheel 17 inch", "Shock absorber front",
+    "Shock absorber rear", "Brake pads front set", "Battery 652", "Battery 646", "Wiper blades pair",
+    "Engine oil 5L", "Workshop gloves", "Printer paper A4 box", "Cleaning supplies", "Coffee and milk",
+]
+STATUS_WEIGHTS = (("approved", 0.62), ("pending", 0.23), ("declined", 0.15))
+FIRST_NAMES = ["Thabo", "Sipho", "Lerato", "Naledi", "Johan", "Pieter", "Ayesha", "Priya", "Michael", "Sarah", "Kagiso", "Zanele"]
+LAST_NAMES = ["Nkosi", "Dlamini", "van der Merwe", "Botha", "Naidoo", "Pillay", "Smith", "Mokoena", "Khumalo", "Jacobs"]
+
+def bench_username(role, number, site_index):
+    return f"{role.lower()}{number}.site{site_index:02d}@bench.local"
+
+def seed_users(users_per_role):
+    """
+    Create missing Admin and Manager accounts for every site. Returns {site: {role: [usernames]}}.
+    """
+    password = hash_password(BENCH_PASSWORD)  # One hash shared by all benchmark users
+    existing = set(db.session.execute(db.select(User.username)).scalars())
+    accounts = {}
+    rows = []
+    for site_index, site in enumerate(DEFAULT_SITES, start=1):
+        accounts[site] = {}
+        for role in ("Admin", "Manager"):
+            names = [bench_username(role, n, site_index) for n in range(1, users_per_role + 1)]
+            accounts[site][role] = names
+            rows.extend(
+                {"username": name, "email": name, "password": password, "role": role, "site": site}
+                for name in names if name not in existing
+            )
+    if rows:
+        db.session.execute(db.insert(User), rows)
+        db.session.commit()
+    print(f"Seeded {len(rows)} users across {len(DEFAULT_SITES)} sites")
+    return accounts
+
+def seed_orders(accounts, total_orders, days, rng):
+    site_weights = [rng.paretovariate(1.5) for _ in DEFAULT_SITES]  # A few very busy stores
+    next_id = (db.session.execute(db.select(db.func.max(Order.id))).scalar() or 0) + 1
+    now = datetime.now()
+    started = time.perf_counter()
+    inserted = 0
+    while inserted < total_orders:
+        orders, items = [], []
+        for _ in range(min(BATCH_SIZE, total_orders - inserted)):
+            site = rng.choices(DEFAULT_SITES, site_weights)[0]
+            submitter_role = rng.choice(("Admin", "Manager"))
+            approver_role = "Manager" if submitter_role == "Admin" else "Admin"
+            created_at = now - timedelta(seconds=rng.randrange(days * 86400))
+            status = rng.choices([s for s, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+            lines = []
+            for position in range(1, rng.choice((1, 1, 2, 2, 3, 4, 5)) + 1):
+                quantity = rng.choice((1, 2, 4, 4, 6, 10))
+                unit_cost = Decimal(str(round(rng.lognormvariate(6, 1), 2))).quantize(Decimal("0.01"))
+                lines.append({
+                    "order_id": next_id,
+                    "position": position,
+                    "quantity": quantity,
+                    "description": rng.choice(ITEM_DESCRIPTIONS),
+                    "unit_cost": unit_cost,
+                    "total_cost": unit_cost * quantity,
+                })
+            total_excl = sum(line["total_cost"] for line in lines)
+            order = {
+                "id": next_id,
+                "supplier": rng.choice(SUPPLIERS),
+                "description": "\n".join(
+                    f"QTY: {l['quantity']}, Description: {l['description']}, "
+                    f"Unit Cost Excl.: {l['unit_cost']}, Total Unit Cost Excl.: {l['total_cost']}"
+                    for l in lines
+                )[:500],
+                "amount": float((total_excl * Decimal("1.15")).quantize(Decimal("0.01"))),
+                "submitter": rng.choice(accounts[site][submitter_role]),
+                "site": site,
+                "created_at": created_at,
+                "updated_at": created_at,
+                "status": status,
+                "approver": None,
+                "approved_at": None,
+                "submitter_emp_number": str(rng.randrange(10000, 99999)),
+                "submitter_emp_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "approver_emp_number": None,
+                "approver_emp_name": None,
+            }
+            if status != "pending":
+                approved_at = created_at + timedelta(minutes=rng.randrange(5, 3 * 24 * 60))
+                order.update(
+                    approver=rng.choice(accounts[site][approver_role]),
+                    approved_at=approved_at,
+                    updated_at=approved_at,
+                    approver_emp_number=str(rng.randrange(10000, 99999)),
+                    approver_emp_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                )
+            orders.append(order)
+            items.extend(lines)
+            next_id += 1
+        db.session.execute(db.insert(Order), orders)
+        db.session.execute(db.insert(OrderItem), items)
+        db.session.commit()
+        inserted += len(orders)
+        rate = inserted / (time.perf_counter() - started)
+        print(f"Inserted {inserted}/{total_orders} orders ({rate:.0f} orders/s)")
+    if db.session.get_bind().dialect.name == "postgresql":
+        # The ids above were assigned here, so move the sequence past them for create_order
+        db.session.execute(text("""SELECT setval(pg_get_serial_sequence('"order"', 'id'), (SELECT max(id) FROM "order"))"""))
+        db.session.commit()
+
+def rebuild_derived():
+    """
+    Bring spend rollups, site counters and the search index in line with the seeded orders.
+    """
+    import site_counters
+    import spend_rollups
+    from migrations import create_order_search
+    spend_rollups.rebuild()
+    site_counters.rebuild()
+    with db.engine.connect() as conn:
+        create_order_search(conn)
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed users and orders for benchmarking.")
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--users-per-role", type=int, default=2, help="Admin and Manager accounts per site")
+    parser.add_argument("--days", type=int, default=730, help="Spread orders over this many past days")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed, for repeatable data sets")
+    parser.add_argument("--skip-derived", action="store_true", help="Do not rebuild spend rollups, site counters and the search index")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        accounts = seed_users(args.users_per_role)
+        seed_orders(accounts, args.orders, args.days, rng)
+        if not args.skip_derived:
+            rebuild_derived()
+    print("Seeding complete")
+
+if __name__ == "__main__":
+    main()
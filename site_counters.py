@@ -0,0 +1,44 @@
+# Recompute or verify the site_order_counter table from the order tables.
+#
+# Usage:
+#   python site_counters.py verify    Compare stored counters with a fresh count (exit code 1 on mismatch)
+#   python site_counters.py rebuild   Replace all counters with a fresh count, then verify
+#
+# The request handlers keep counters current incrementally; this is for recovery and auditing.
+# Archived orders are still counted, so archive_orders.py only bumps each site's version.
+# Only the aggregation lives here; aggregates.py compares and replaces the table.
+from aggregates import SummaryTable
+from app import db, ArchivedOrder, Order, SiteOrderCounter
+from decimal import Decimal
+
+def compute_counters(conn):
+    """
+    Count live and archived orders per site and status with GROUP BY queries.
+    Returns {(site,): [pending_count, pending_total, approved_count, declined_count]}.
+    """
+    counters = {}
+    for model in (Order, ArchivedOrder):
+        rows = conn.execute(
+            db.select(model.site, model.status, db.func.count(), db.func.sum(model.amount))
+            .group_by(model.site, model.status)
+        )
+        for site, status, count, total in rows:
+            entry = counters.setdefault((site,), [0, Decimal("0.00"), 0, 0])
+            if status == "pending":
+                entry[0] += count
+                entry[1] += Decimal(str(total or 0)).quantize(Decimal("0.01"))
+            elif status == "approved":
+                entry[2] += count
+            elif status == "declined":
+                entry[3] += count
+    return counters
+
+table = SummaryTable(
+    SiteOrderCounter, ["site"], ["pending_count", "pending_total", "approved_count", "declined_count"],
+    compute_counters, label="site order counter", script="site_counters.py", version_column="version"
+)
+rebuild = table.rebuild
+verify = table.verify
+
+if __name__ == "__main__":
+    table.main()
@@ -0,0 +1,48 @@
+# Recompute or verify the spend_rollup table from the order table.
+#
+# Usage:
+#   python spend_rollups.py verify    Compare stored rollups with a fresh computation (exit code 1 on mismatch)
+#   python spend_rollups.py rebuild   Replace all rollups with a fresh computation, then verify
+#
+# The request handlers keep rollups current incrementally; this is for recovery and auditing.
+# Only the aggregation lives here; aggregates.py compares and replaces the table.
+from aggregates import SummaryTable
+from app import db, ArchivedOrder, Order, SpendRollup, month_start
+from decimal import Decimal
+
+CHUNK_SIZE = 5000
+
+def compute_rollups(conn):
+    """
+    Aggregate approved and pending order totals per (site, month, supplier), streaming
+    live and archived orders through server-side cursors. Returns {key: [pending_total,
+    pending_count, approved_total, approved_count]}.
+    """
+    totals = {}
+    for model in (Order, ArchivedOrder):
+        query = (
+            db.select(model.site, model.created_at, model.supplier, model.status, model.amount)
+            .where(model.status.in_(("pending", "approved")))
+            .execution_options(yield_per=CHUNK_SIZE)
+        )
+        for site, created_at, supplier, status, amount in conn.execute(query):
+            key = (site, month_start(created_at), supplier)
+            entry = totals.setdefault(key, [Decimal("0.00"), 0, Decimal("0.00"), 0])
+            amount = Decimal(str(amount)).quantize(Decimal("0.01"))
+            if status == "pending":
+                entry[0] += amount
+                entry[1] += 1
+            else:
+                entry[2] += amount
+                entry[3] += 1
+    return totals
+
+table = SummaryTable(
+    SpendRollup, ["site", "month", "supplier"], ["pending_total", "pending_count", "approved_total", "approved_count"],
+    compute_rollups, label="spend rollup", script="spend_rollups.py"
+)
+rebuild = table.rebuild
+verify = table.verify
+
+if __name__ == "__main__":
+    table.main()
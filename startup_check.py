@@ -0,0 +1,75 @@
+# Measure application cold start: the time a fresh process needs to import app.py and serve
+# its first request. Each run is a new interpreter, like a gunicorn master or a worker
+# without preload.
+#
+# Usage:
+#   python startup_check.py [--runs N] [--budget-ms MS]
+#
+# Exits with code 1 if the median start-up time is over budget, or if importing the app
+# opened a database connection (schema management belongs in migrations.py).
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+STARTUP_BUDGET_MS = int(os.getenv("STARTUP_BUDGET_MS", 1500))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+connects = []
+event.listen(Engine, "connect", lambda *args: connects.append(1))
+import app
+imported = time.perf_counter()
+connects_on_import = len(connects)
+response = app.app.test_client().get("/healthz")
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (served - imported) * 1000,
+    "total_ms": (served - start) * 1000,
+    "connects_on_import": connects_on_import,
+    "status": response.status_code,
+}))
+"""
+
+def measure_once():
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure application cold-start time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=int, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    for key in ("import_ms", "first_request_ms", "total_ms"):
+        values = [run[key] for run in runs]
+        print(f"{key:<18} median {statistics.median(values):7.1f}  max {max(values):7.1f}")
+
+    ok = True
+    median_total = statistics.median(run["total_ms"] for run in runs)
+    if median_total > args.budget_ms:
+        print(f"Cold start of {median_total:.0f} ms is over the {args.budget_ms} ms budget")
+        ok = False
+    if any(run["connects_on_import"] for run in runs):
+        print("Importing app.py opened a database connection")
+        ok = False
+    if any(run["status"] != 200 for run in runs):
+        print("Health check did not return 200")
+        ok = False
+    if ok:
+        print(f"Cold start of {median_total:.0f} ms is within the {args.budget_ms} ms budget")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Shared fixtures: an application on a throwaway SQLite database, with users and orders
+# created directly through the models.
+#
+# Usage (from the repository root):
+#   pip install -r requirements-dev.txt
+#   python -m pytest
+import os
+import sys
+
+# Cheap password hashes; the production default is deliberately slow
+os.environ.setdefault("PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+import app as app_module
+from app import create_app, db, hash_password, Order, OrderItem, User
+
+SITE = "TWT Alberton"
+PASSWORD = "Pass123!"
+
+@pytest.fixture
+def database_uri():
+    """
+    In-memory by default; tests that need several connections override this with a file.
+    """
+    return "sqlite://"
+
+@pytest.fixture
+def app(database_uri):
+    application = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": database_uri,
+        "SERVER_NAME": "localhost",
+    })
+    for cache in (app_module.user_cache, app_module.site_cache, app_module.approver_cache, app_module.fragment_cache):
+        cache.clear()
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+def add_user(username, role, site=SITE):
+    user = User(username=username, email=username, password=hash_password(PASSWORD), role=role, site=site)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def add_orders(count, submitter, site=SITE, status_for=lambda i: "pending"):
+    """
+    Create count orders with two line items each, oldest first. Returns their ids.
+    """
+    started = datetime(2025, 1, 1)
+    orders = []
+    for i in range(count):
+        status = status_for(i)
+        created_at = started + timedelta(hours=i)
+        order = Order(
+            supplier=f"Supplier {i % 7}", description="", amount=115.0 + i, submitter=submitter, site=site,
+            created_at=created_at, updated_at=created_at, status=status,
+            approved_at=created_at + timedelta(hours=1) if status != "pending" else None,
+            submitter_emp_number="1001", submitter_emp_name="Thabo Nkosi",
+            items=[
+                OrderItem(position=1, quantity=2, description="Potenza tyre 205/55R16",
+                          unit_cost=Decimal("40.00"), total_cost=Decimal("80.00")),
+                OrderItem(position=2, quantity=1, description="Wheel balancing weights",
+                          unit_cost=Decimal("20.00"), total_cost=Decimal("20.00")),
+            ],
+        )
+        orders.append(order)
+    db.session.add_all(orders)
+    db.session.commit()
+    return [order.id for order in orders]
+
+def login(client, username):
+    response = client.post("/login", data={"username": username, "password": PASSWORD})
+    assert response.status_code == 302, f"login as {username} failed"
+    return client
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+
+import archive_orders
+import site_counters
+from app import db
+from conftest import add_orders, add_user, login
+
+@pytest.fixture
+def database_uri(tmp_path):
+    # archive_orders.py works on its own connection, which an in-memory database would not share
+    return f"sqlite:///{tmp_path / 'api.db'}"
+
+def test_archiving_changes_the_orders_etag(app):
+    add_user("admin@site.local", "Admin")
+    add_user("manager@site.local", "Manager")
+    order_ids = add_orders(3, "admin@site.local", status_for=lambda i: "pending" if i == 2 else "approved")
+    site_counters.rebuild()
+    client = login(app.test_client(), "manager@site.local")
+
+    first = client.get("/api/orders")
+    etag = first.headers["ETag"]
+    assert [order["id"] for order in first.get_json()["orders"]] == order_ids[::-1]
+    assert client.get("/api/orders", headers={"If-None-Match": etag}).status_code == 304
+
+    with db.engine.connect() as conn:
+        assert archive_orders.archive_batch(conn, datetime(2026, 1, 1), 100) == 2
+
+    after = client.get("/api/orders", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert [order["id"] for order in after.get_json()["orders"]] == [order_ids[2]]
+    assert site_counters.verify()
+
+def test_pending_count_reads_the_site_counter(app):
+    add_user("admin@site.local", "Admin")
+    add_user("manager@site.local", "Manager")
+    add_orders(5, "admin@site.local", status_for=lambda i: "pending" if i % 2 else "approved")
+    site_counters.rebuild()
+    client = login(app.test_client(), "manager@site.local")
+
+    assert client.get("/api/orders/pending_count").get_json() == {"site": "TWT Alberton", "pending": 2}
+
+    with db.engine.connect() as conn:
+        assert archive_orders.archive_batch(conn, datetime(2026, 1, 1), 100) == 3
+    assert client.get("/api/orders/pending_count").get_json()["pending"] == 2
@@ -0,0 +1,42 @@
+from sqlalchemy import event
+
+from app import db
+from conftest import add_orders, add_user, login
+
+# Statements for one dashboard render: the page of orders with submitter roles, line items for
+# the rows that are not cached (two, via selectinload), the rollup and budget rows for the
+# budget summary, and the site counters. It must not depend on how many orders are on the page.
+MAX_DASHBOARD_STATEMENTS = 6
+
+def count_statements(app, request):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = request()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return response, statements
+
+def test_dashboard_statement_count_is_bounded(app):
+    add_user("admin@site.local", "Admin")
+    add_user("manager@site.local", "Manager")
+    add_orders(100, "admin@site.local", status_for=lambda i: ("pending", "approved", "declined")[i % 3])
+    client = login(app.test_client(), "manager@site.local")
+
+    for per_page in (25, 100):  # Cold and then partly cached rows
+        response, statements = count_statements(app, lambda: client.get(f"/?per_page={per_page}"))
+        assert response.status_code == 200
+        assert response.get_data(as_text=True).count('class="bulk-select"') > 0
+        assert len(statements) <= MAX_DASHBOARD_STATEMENTS, "\n".join(statements)
+
+def test_dashboard_statement_count_does_not_grow_with_page_size(app):
+    add_user("admin@site.local", "Admin")
+    add_user("manager@site.local", "Manager")
+    add_orders(100, "admin@site.local")
+    client = login(app.test_client(), "manager@site.local")
+
+    _, small_page = count_statements(app, lambda: client.get("/?per_page=25"))
+    _, large_page = count_statements(app, lambda: client.get("/?per_page=100"))
+    assert len(large_page) == len(small_page)
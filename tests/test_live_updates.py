@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import app as app_module
+from conftest import add_orders, add_user, login
+
+@pytest.fixture
+def live_updates(monkeypatch):
+    monkeypatch.setattr(app_module, "LIVE_UPDATES_ENABLED", True)
+    monkeypatch.setattr(app_module, "LIVE_UPDATES_STREAM_SECONDS", 0)  # End each stream straight away
+    monkeypatch.setattr(app_module, "order_events_broker", app_module.OrderEventBroker())
+    monkeypatch.setattr(app_module.OrderEventBroker, "_run", lambda self, app: None)  # No feed thread
+
+def read_events(body):
+    events = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "data" in fields:
+            events.append((fields.get("id"), json.loads(fields["data"])))
+    return events
+
+def test_event_streams_are_off_by_default(app):
+    add_user("manager@site.local", "Manager")
+    client = login(app.test_client(), "manager@site.local")
+    assert client.get("/events").status_code == 404
+    page = client.get("/").get_data(as_text=True)
+    assert "EventSource" not in page
+    assert "/order_changes" in page
+
+def test_periodic_check_returns_changes_after_the_cursor(app):
+    add_user("admin@site.local", "Admin")
+    add_user("manager@site.local", "Manager")
+    order_ids = add_orders(3, "admin@site.local")
+    client = login(app.test_client(), "manager@site.local")
+    assert client.get("/order_changes?since=yesterday").status_code == 400
+
+    last_seen = app_module.db.session.get(app_module.Order, order_ids[0]).updated_at
+    data = client.get("/order_changes", query_string={"since": app_module.live_update_cursor(last_seen)}).get_json()
+    assert [change[0] for change in data["changes"]] == order_ids[1:]
+    assert data["cursor"] == data["changes"][-1][2]
+    again = client.get("/order_changes", query_string={"since": data["cursor"]}).get_json()
+    assert again == {"changes": [], "cursor": data["cursor"]}
+
+def test_reconnecting_stream_catches_up_from_last_event_id(app, live_updates):
+    add_user("admin@site.local", "Admin")
+    add_user("manager@site.local", "Manager")
+    order_ids = add_orders(4, "admin@site.local")
+    client = login(app.test_client(), "manager@site.local")
+    assert "EventSource" in client.get("/").get_data(as_text=True)
+
+    assert read_events(client.get("/events").get_data(as_text=True)) == []
+
+    last_seen = app_module.db.session.get(app_module.Order, order_ids[1]).updated_at
+    response = client.get("/events", headers={"Last-Event-ID": app_module.live_update_cursor(last_seen)})
+    [(event_id, changes)] = read_events(response.get_data(as_text=True))
+    assert [change[0] for change in changes] == order_ids[2:]
+    assert event_id == changes[-1][2]
+    assert app_module.order_events_broker.stream_count() == 0
@@ -0,0 +1,24 @@
+from conftest import add_orders, add_user, login
+
+def test_print_page_revalidates_unless_messages_are_pending(app):
+    add_user("admin@site.local", "Admin")
+    add_user("manager@site.local", "Manager")
+    order_id = add_orders(1, "admin@site.local", status_for=lambda i: "approved")[0]
+    client = login(app.test_client(), "manager@site.local")
+    client.get("/")  # Shows and clears the login message
+
+    first = client.get(f"/print/{order_id}")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert client.get(f"/print/{order_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    # The redirect after send_to_supplier must show its message, not a cached page without it
+    response = client.post(f"/send_to_supplier/{order_id}", data={"supplier_email": "orders@supplier.example"})
+    assert response.status_code == 302
+    page = client.get(f"/print/{order_id}", headers={"If-None-Match": etag})
+    assert page.status_code == 200
+    assert f"Order #{order_id} queued for delivery to orders@supplier.example." in page.get_data(as_text=True)
+    assert page.headers["Cache-Control"] == "no-store"
+    assert "ETag" not in page.headers
+
+    assert client.get(f"/print/{order_id}", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,134 @@
+import email
+import socket
+import stat
+
+import pytest
+
+import app as app_module
+import email_worker
+from app import db, EmailOutbox
+from conftest import add_orders, add_user, login
+
+OTHER_SITE = "TWT Woodmead"
+
+@pytest.fixture
+def fake_chrome(tmp_path, monkeypatch):
+    """
+    Stand-in for headless Chrome that writes a tiny PDF and records each call.
+    """
+    calls = tmp_path / "chrome_calls"
+    script = tmp_path / "chrome"
+    script.write_text(
+        "#!/bin/sh\n"
+        f"echo call >> {calls}\n"
+        'for a in "$@"; do case "$a" in --print-to-pdf=*) printf "%%PDF-1.4 stand-in" > "${a#--print-to-pdf=}";; esac; done\n'
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(app_module, "CHROME_BIN", str(script))
+    return lambda: len(calls.read_text().splitlines()) if calls.exists() else 0
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    """
+    Local SMTP stand-in (plain SMTP, no TLS or AUTH) that keeps every message it receives.
+    """
+    controller_module = pytest.importorskip("aiosmtpd.controller")
+
+    class Handler:
+        def __init__(self):
+            self.messages = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages.append(email.message_from_bytes(envelope.content))
+            return "250 Message accepted for delivery"
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = Handler()
+    controller = controller_module.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_USE_TLS", "false")
+    yield handler
+    app_module.smtp_pool.close_all()
+    controller.stop()
+
+@pytest.fixture
+def approved_order(app):
+    add_user("admin@site.local", "Admin")
+    add_user("manager@site.local", "Manager")
+    add_user("outsider@other.local", "Manager", site=OTHER_SITE)
+    return add_orders(1, "admin@site.local", status_for=lambda i: "approved")[0]
+
+def test_orders_of_other_sites_are_not_found(app, approved_order, fake_chrome):
+    client = login(app.test_client(), "outsider@other.local")
+    assert client.get(f"/print/{approved_order}").status_code == 404
+    assert client.get(f"/print/{approved_order}/pdf").status_code == 404
+    response = client.post(f"/send_to_supplier/{approved_order}", data={"supplier_email": "someone@example.com"})
+    assert response.status_code == 404
+    assert db.session.execute(db.select(db.func.count()).select_from(EmailOutbox)).scalar() == 0
+    assert fake_chrome() == 0
+
+def test_supplier_email_is_queued_without_rendering_the_pdf(app, approved_order, fake_chrome):
+    client = login(app.test_client(), "manager@site.local")
+    response = client.post(f"/send_to_supplier/{approved_order}", data={"supplier_email": "orders@supplier.example"})
+    assert response.status_code == 302
+    message = db.session.execute(db.select(EmailOutbox)).scalar_one()
+    assert message.pdf_order_id == approved_order
+    assert message.attachment is None
+    assert fake_chrome() == 0
+
+def test_worker_attaches_the_order_pdf(app, approved_order, fake_chrome, smtp_server):
+    client = login(app.test_client(), "manager@site.local")
+    client.post(f"/send_to_supplier/{approved_order}", data={"supplier_email": "orders@supplier.example"})
+    client.post(f"/send_to_supplier/{approved_order}", data={"supplier_email": "accounts@supplier.example"})
+
+    assert email_worker.process_batch() == 2
+    assert [m["To"] for m in smtp_server.messages] == ["orders@supplier.example", "accounts@supplier.example"]
+    for sent in smtp_server.messages:
+        attachments = [part for part in sent.walk() if part.get_content_type() == "application/pdf"]
+        assert len(attachments) == 1
+        assert attachments[0].get_filename() == f"order-{approved_order}.pdf"
+        assert attachments[0].get_payload(decode=True).startswith(b"%PDF")
+    assert fake_chrome() == 1  # The approved order's PDF is stored after the first render
+    statuses = db.session.execute(db.select(EmailOutbox.status)).scalars().all()
+    assert statuses == ["sent", "sent"]
+
+def test_failed_pdf_render_is_retried(app, approved_order, fake_chrome, smtp_server, monkeypatch):
+    monkeypatch.setattr(app_module, "CHROME_BIN", "/nonexistent/chrome")
+    client = login(app.test_client(), "manager@site.local")
+    client.post(f"/send_to_supplier/{approved_order}", data={"supplier_email": "orders@supplier.example"})
+
+    assert email_worker.process_batch() == 1
+    message = db.session.execute(db.select(EmailOutbox)).scalar_one()
+    assert message.status == "pending" and message.attempts == 1 and message.last_error
+    assert smtp_server.messages == []
+
+def test_pdf_download_is_rendered_by_the_worker(app, approved_order, fake_chrome):
+    client = login(app.test_client(), "manager@site.local")
+    response = client.get(f"/print/{approved_order}/pdf", follow_redirects=True)
+    assert response.request.path == f"/print/{approved_order}"
+    assert "The PDF for this order is being prepared." in response.get_data(as_text=True)
+    assert fake_chrome() == 0
+
+    assert email_worker.render_pdf_batch() == 1
+    assert email_worker.render_pdf_batch() == 0
+    response = client.get(f"/print/{approved_order}/pdf")
+    assert response.status_code == 200
+    assert response.mimetype == "application/pdf"
+    assert response.get_data().startswith(b"%PDF")
+    assert fake_chrome() == 1
+
+def test_failed_pdf_download_is_reported_and_queued_again(app, approved_order, fake_chrome, monkeypatch):
+    monkeypatch.setattr(app_module, "CHROME_BIN", "/nonexistent/chrome")
+    client = login(app.test_client(), "manager@site.local")
+    client.get(f"/print/{approved_order}/pdf")
+    for _ in range(app_module.PDF_MAX_ATTEMPTS):
+        assert email_worker.render_pdf_batch() == 1
+    assert email_worker.render_pdf_batch() == 0
+
+    response = client.get(f"/print/{approved_order}/pdf", follow_redirects=True)
+    assert "Could not generate the PDF for this order." in response.get_data(as_text=True)
+    assert email_worker.render_pdf_batch() == 1
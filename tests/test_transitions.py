@@ -0,0 +1,65 @@
+import re
+import threading
+
+import pytest
+
+import site_counters
+import spend_rollups
+from app import db, Order
+from conftest import add_orders, add_user, login
+
+RACES = 10
+
+@pytest.fixture
+def database_uri(tmp_path):
+    # Each racing request needs its own connection, which an in-memory database cannot give
+    return f"sqlite:///{tmp_path / 'race.db'}"
+
+def post_and_read_flashes(client, path):
+    response = client.post(path, data={"approver_emp_number": "2002", "approver_emp_name": "Lerato Dlamini"}, follow_redirects=True)
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+def test_concurrent_approve_and_decline_have_one_winner(app):
+    add_user("admin@site.local", "Admin")
+    add_user("manager1@site.local", "Manager")
+    add_user("manager2@site.local", "Manager")
+    order_ids = add_orders(RACES, "admin@site.local")
+    spend_rollups.rebuild()
+    site_counters.rebuild()
+    # Separate app contexts, or the second login would see the first user cached in g and be skipped
+    with app.app_context():
+        approver = login(app.test_client(), "manager1@site.local")
+    with app.app_context():
+        decliner = login(app.test_client(), "manager2@site.local")
+
+    for order_id in order_ids:
+        barrier = threading.Barrier(2)
+        pages = {}
+
+        def race(name, client, path):
+            barrier.wait()
+            pages[name] = post_and_read_flashes(client, path)
+
+        threads = [
+            threading.Thread(target=race, args=("approve", approver, f"/approve/{order_id}")),
+            threading.Thread(target=race, args=("decline", decliner, f"/decline/{order_id}")),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        approved = f"Order #{order_id} has been successfully approved." in pages["approve"]
+        declined = f"Order #{order_id} has been declined." in pages["decline"]
+        assert approved != declined, "exactly one request must win"
+        loser = pages["decline"] if approved else pages["approve"]
+        assert re.search(rf"Order #{order_id} is no longer pending: it has already been (approved|declined)\.", loser)
+
+        db.session.expire_all()
+        order = db.session.get(Order, order_id)
+        assert order.status == ("approved" if approved else "declined")
+        assert order.approver == ("manager1@site.local" if approved else "manager2@site.local")
+
+    assert spend_rollups.verify()
+    assert site_counters.verify()